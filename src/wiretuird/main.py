@@ -1,16 +1,47 @@
+import asyncio
 import os
-import subprocess
+import select
+import socket
+import struct
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
-from textual import events
+from textual import events, work
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Vertical
+from textual.timer import Timer
 from textual.widgets import Button, DataTable
+from textual.worker import get_current_worker
 
 
 WIREGUARD_DIR = Path("/etc/wireguard")
+RESIZE_DEBOUNCE = 0.05
+WG_QUICK_SETTLE = 0.1
+# The app never changes its effective UID, so checking once is enough.
+_IS_ROOT = os.geteuid() == 0
+
+_ACTIVE_TTL = 2.0
+_ACTIVE_CACHE: tuple[float, set[str]] | None = None
+
+# rtnetlink constants, see linux/netlink.h, linux/rtnetlink.h and linux/if_link.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+IFLA_IFNAME = 3
+IFLA_LINKINFO = 18
+IFLA_INFO_KIND = 1
+RTMGRP_LINK = 0x1
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_RTATTR = struct.Struct("=HH")
+_NETLINK_BUFSIZE = 65536
 
 
 @dataclass(slots=True)
@@ -20,64 +51,196 @@ class ConfigItem:
     active: bool
 
 
-def get_active_interfaces() -> set[str]:
-    result = subprocess.run(
-        ["wg", "show", "interfaces"],
-        capture_output=True,
-        text=True,
-        check=False,
+async def get_active_interfaces(force: bool = False) -> set[str]:
+    global _ACTIVE_CACHE
+
+    now = time.monotonic()
+    if not force and _ACTIVE_CACHE is not None:
+        cached_at, cached = _ACTIVE_CACHE
+        if now - cached_at < _ACTIVE_TTL:
+            return set(cached)
+
+    active = _netlink_active_interfaces()
+    if active is None:
+        active = await _wg_show_interfaces()
+
+    _ACTIVE_CACHE = (now, active)
+    return set(active)
+
+
+def _rtattr(attr_type: int, payload: bytes) -> bytes:
+    length = _RTATTR.size + len(payload)
+    padding = b"\0" * (-length % 4)
+    return _RTATTR.pack(length, attr_type) + payload + padding
+
+
+def _rtattrs(data: bytes) -> dict[int, bytes]:
+    attrs: dict[int, bytes] = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        # Strip NLA_F_NESTED / NLA_F_NET_BYTEORDER.
+        attrs[attr_type & 0x3FFF] = data[offset + _RTATTR.size : offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+
+def _netlink_messages(data: bytes) -> Iterator[tuple[int, bytes]]:
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _flags, _seq, _pid = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        yield msg_type, data[offset + _NLMSGHDR.size : offset + length]
+        offset += (length + 3) & ~3
+
+
+def _parse_link(payload: bytes) -> tuple[str | None, str | None]:
+    attrs = _rtattrs(payload[_IFINFOMSG.size :])
+    name = attrs.get(IFLA_IFNAME)
+    kind = _rtattrs(attrs.get(IFLA_LINKINFO, b"")).get(IFLA_INFO_KIND)
+    return (
+        name.rstrip(b"\0").decode() if name else None,
+        kind.rstrip(b"\0").decode() if kind else None,
+    )
+
+
+def _netlink_active_interfaces() -> set[str] | None:
+    # Ask the kernel to filter the dump on IFLA_INFO_KIND so it only
+    # serializes WireGuard links; the kind is re-checked below for kernels
+    # that ignore the filter.
+    body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) + _rtattr(
+        IFLA_LINKINFO, _rtattr(IFLA_INFO_KIND, b"wireguard\0")
     )
-    if result.returncode != 0:
+    header = _NLMSGHDR.pack(
+        _NLMSGHDR.size + len(body), RTM_GETLINK, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+    )
+
+    active: set[str] = set()
+    try:
+        with socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE
+        ) as sock:
+            sock.sendall(header + body)
+            while True:
+                for msg_type, payload in _netlink_messages(
+                    sock.recv(_NETLINK_BUFSIZE)
+                ):
+                    if msg_type == NLMSG_DONE:
+                        return active
+                    if msg_type == NLMSG_ERROR:
+                        return None
+                    if msg_type == RTM_NEWLINK:
+                        name, kind = _parse_link(payload)
+                        if name and kind == "wireguard":
+                            active.add(name)
+    except OSError:
+        return None
+
+
+async def _wg_show_interfaces() -> set[str]:
+    returncode, stdout, _ = await _run_command(["wg", "show", "interfaces"])
+    if returncode != 0:
         return set()
-    return {name for name in result.stdout.strip().split() if name}
+    return {name for name in stdout.strip().split() if name}
 
 
-def list_wireguard_configs() -> list[str]:
+async def list_wireguard_configs() -> list[str]:
+    try:
+        with os.scandir(WIREGUARD_DIR) as entries:
+            return sorted(
+                entry.name
+                for entry in entries
+                if entry.name.endswith(".conf") and entry.is_file()
+            )
+    except FileNotFoundError:
+        return []
+    except PermissionError:
+        # /etc/wireguard is usually root-only; list it through sudo instead.
+        return await _list_wireguard_configs_privileged()
+
+
+async def _list_wireguard_configs_privileged() -> list[str]:
     cmd = _with_privileges(["ls", str(WIREGUARD_DIR)])
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    returncode, stdout, _ = await _run_command(cmd)
 
-    if result.returncode != 0:
+    if returncode != 0:
         return []
 
     return sorted(
-        {
-            line.strip()
-            for line in result.stdout.splitlines()
-            if line.strip() and line.strip().endswith(".conf")
-        }
+        name
+        for line in stdout.splitlines()
+        if (name := line.strip()).endswith(".conf")
     )
 
 
-def build_config_items() -> list[ConfigItem]:
-    active_interfaces = get_active_interfaces()
+async def build_config_items(
+    active_interfaces: set[str] | None = None,
+    items_by_name: dict[str, ConfigItem] | None = None,
+) -> list[ConfigItem]:
+    if active_interfaces is None:
+        active_interfaces, file_names = await asyncio.gather(
+            get_active_interfaces(), list_wireguard_configs()
+        )
+    else:
+        file_names = await list_wireguard_configs()
+
+    # Reuse items from previous refreshes and only allocate for new files.
+    if items_by_name is None:
+        items_by_name = {}
+    for file_name in items_by_name.keys() - set(file_names):
+        del items_by_name[file_name]
+
     items: list[ConfigItem] = []
 
-    for file_name in list_wireguard_configs():
-        interface = file_name[:-5] if file_name.endswith(".conf") else file_name
-        items.append(
-            ConfigItem(
+    for file_name in file_names:
+        item = items_by_name.get(file_name)
+        if item is None:
+            interface = file_name[:-5] if file_name.endswith(".conf") else file_name
+            item = items_by_name[file_name] = ConfigItem(
                 file_name=file_name,
                 interface=interface,
                 active=interface in active_interfaces,
             )
-        )
+        else:
+            item.active = item.interface in active_interfaces
+        items.append(item)
 
     return items
 
 
 def _with_privileges(command: Iterable[str]) -> list[str]:
     cmd = list(command)
-    if os.geteuid() == 0:
+    if _IS_ROOT:
         return cmd
     return ["sudo", "-n", *cmd]
 
 
-def run_wg_quick(action: str, interface: str) -> tuple[bool, str]:
+async def _run_command(cmd: list[str]) -> tuple[int, str, str]:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as exc:
+        return 127, "", str(exc)
+    stdout, stderr = await proc.communicate()
+    return (
+        proc.returncode or 0,
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+    )
+
+
+async def run_wg_quick(action: str, interface: str) -> tuple[bool, str]:
     cmd = _with_privileges(["wg-quick", action, interface])
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    if result.returncode == 0:
+    returncode, stdout, stderr = await _run_command(cmd)
+    if returncode == 0:
         return True, f"Interface '{interface}' {action} succeeded."
-    stderr = result.stderr.strip() or result.stdout.strip() or "Unknown error"
+    stderr = stderr.strip() or stdout.strip() or "Unknown error"
     return False, f"wg-quick {action} failed: {stderr}"
 
 
@@ -116,6 +279,17 @@ class WGManagerApp(App[None]):
 
     selected_interface: str | None = None
     row_interfaces: list[str] = []
+    _iface_to_row: dict[str, int] = {}
+    # Active flag currently rendered for each row, keyed like the rows.
+    _row_states: dict[str, bool] = {}
+    _items_by_name: dict[str, ConfigItem]
+    # Maintained from netlink link events while the watcher runs; None means
+    # we fall back to polling get_active_interfaces().
+    _active_interfaces: set[str] | None = None
+    _resize_timer: Timer | None = None
+    _table: DataTable
+    _wg_buttons: tuple[Button, Button]
+    _wg_running = False
 
     def compose(self) -> ComposeResult:
         with Vertical(id="panel"):
@@ -126,20 +300,35 @@ class WGManagerApp(App[None]):
                 yield Button("Refresh", id="refresh_btn")
                 yield Button("Quit", id="quit_btn", variant="error")
 
-    def on_mount(self) -> None:
-        table = self.query_one("#config_table", DataTable)
-        table.add_columns("State", "Config", "Interface")
+    async def on_mount(self) -> None:
+        self._items_by_name = {}
+        # Widgets live for the whole app; look them up once.
+        self._table = table = self.query_one("#config_table", DataTable)
+        self._wg_buttons = (
+            self.query_one("#up_btn", Button),
+            self.query_one("#down_btn", Button),
+        )
+        table.add_column("State", key="state")
+        table.add_column("Config", key="config")
+        table.add_column("Interface", key="interface")
         table.cursor_type = "row"
         table.zebra_stripes = True
         self._apply_table_density(self.size.width)
-        self.refresh_table()
+        await self.refresh_table()
         table.focus()
+        self._watch_links()
 
     def on_resize(self, event: events.Resize) -> None:
-        self._apply_table_density(event.size.width)
+        # Terminal drags emit bursts of resize events; only lay out the last.
+        if self._resize_timer is not None:
+            self._resize_timer.stop()
+        width = event.size.width
+        self._resize_timer = self.set_timer(
+            RESIZE_DEBOUNCE, lambda: self._apply_table_density(width)
+        )
 
     def _apply_table_density(self, width: int) -> None:
-        table = self.query_one("#config_table", DataTable)
+        table = self._table
         if width >= 180:
             table.cell_padding = 4
         elif width >= 140:
@@ -149,25 +338,47 @@ class WGManagerApp(App[None]):
         else:
             table.cell_padding = 1
 
-    def refresh_table(self) -> None:
-        table = self.query_one("#config_table", DataTable)
+    async def refresh_table(self) -> None:
+        items = await build_config_items(
+            self._active_interfaces, self._items_by_name
+        )
+
+        table = self._table
         previous = self._current_interface()
-        table.clear()
 
-        items = build_config_items()
+        # Only touch rows that changed; most refreshes flip a single state.
+        rendered = self._row_states
+        current = {item.interface for item in items}
+        for interface in rendered.keys() - current:
+            table.remove_row(interface)
+
+        added = False
+        for item in items:
+            state = "ACTIVE" if item.active else ""
+            shown = rendered.get(item.interface)
+            if shown is None:
+                table.add_row(state, item.file_name, item.interface, key=item.interface)
+                added = True
+            elif shown != item.active:
+                table.update_cell(item.interface, "state", state, update_width=True)
+        if added:
+            # Keep rows in the same order as items (sorted by file name).
+            table.sort("config")
+
+        self._row_states = {item.interface: item.active for item in items}
         self.row_interfaces = [item.interface for item in items]
+        self._iface_to_row = {}
 
         active_row = None
 
         for idx, item in enumerate(items):
-            state = "ACTIVE" if item.active else ""
-            table.add_row(state, item.file_name, item.interface, key=item.interface)
+            self._iface_to_row[item.interface] = idx
             if item.active and active_row is None:
                 active_row = idx
 
         target_row = None
-        if previous and previous in self.row_interfaces:
-            target_row = self.row_interfaces.index(previous)
+        if previous and previous in self._iface_to_row:
+            target_row = self._iface_to_row[previous]
         elif active_row is not None:
             target_row = active_row
         elif self.row_interfaces:
@@ -181,6 +392,69 @@ class WGManagerApp(App[None]):
 
         self.sub_title = self._build_sub_title(items)
 
+    @work(thread=True, exclusive=True, group="netlink")
+    def _watch_links(self) -> None:
+        worker = get_current_worker()
+        try:
+            sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE
+            )
+            sock.bind((0, RTMGRP_LINK))
+        except OSError:
+            return
+
+        with sock:
+            # Seed after subscribing so no event between dump and bind is lost.
+            active = _netlink_active_interfaces()
+            while active is not None and not worker.is_cancelled:
+                self.call_from_thread(self._set_active_interfaces, active)
+                active = self._read_link_events(sock)
+
+        if not worker.is_cancelled:
+            self.call_from_thread(self._set_active_interfaces, None)
+
+    def _read_link_events(self, sock: socket.socket) -> set[str] | None:
+        worker = get_current_worker()
+        while not worker.is_cancelled:
+            readable, _, _ = select.select([sock], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = sock.recv(_NETLINK_BUFSIZE)
+            except OSError:
+                # Typically ENOBUFS after an overrun: events were dropped, so
+                # resynchronize with a full dump.
+                return _netlink_active_interfaces()
+            for msg_type, payload in _netlink_messages(data):
+                name, kind = _parse_link(payload)
+                if not name:
+                    continue
+                if msg_type == RTM_NEWLINK and kind == "wireguard":
+                    self.call_from_thread(self._on_link_event, name, True)
+                elif msg_type == RTM_DELLINK:
+                    self.call_from_thread(self._on_link_event, name, False)
+        return None
+
+    async def _set_active_interfaces(self, active: set[str] | None) -> None:
+        self._active_interfaces = active
+        await self.refresh_table()
+
+    async def _on_link_event(self, interface: str, present: bool) -> None:
+        if self._active_interfaces is None:
+            return
+        if present == (interface in self._active_interfaces):
+            return
+        if present:
+            self._active_interfaces.add(interface)
+        else:
+            self._active_interfaces.discard(interface)
+        await self.refresh_table()
+
+    async def _sync_active_interfaces(self) -> None:
+        active = await get_active_interfaces(force=True)
+        if self._active_interfaces is not None:
+            self._active_interfaces = active
+
     def _build_sub_title(self, items: list[ConfigItem]) -> str:
         if not items:
             return "No .conf files found in /etc/wireguard"
@@ -190,7 +464,7 @@ class WGManagerApp(App[None]):
         return f"Active: {', '.join(active)}"
 
     def _current_interface(self) -> str | None:
-        table = self.query_one("#config_table", DataTable)
+        table = self._table
         cursor_row = table.cursor_row
         if isinstance(cursor_row, int) and 0 <= cursor_row < len(self.row_interfaces):
             interface = self.row_interfaces[cursor_row]
@@ -201,36 +475,55 @@ class WGManagerApp(App[None]):
     def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
         self.selected_interface = str(event.row_key.value)
 
-    def action_refresh_configs(self) -> None:
-        self.refresh_table()
+    async def action_refresh_configs(self) -> None:
+        await self._sync_active_interfaces()
+        await self.refresh_table()
 
     def action_bring_up(self) -> None:
-        interface = self._current_interface()
-        if not interface:
-            self.sub_title = "No interface selected"
-            return
-        ok, msg = run_wg_quick("up", interface)
-        self.refresh_table()
-        if not ok:
-            self.sub_title = msg
+        self._start_wg_quick("up")
 
     def action_bring_down(self) -> None:
+        self._start_wg_quick("down")
+
+    def _start_wg_quick(self, action: str) -> None:
+        # Ignore repeats while wg-quick is running rather than cancelling it
+        # halfway through an up/down.
+        if self._wg_running:
+            return
         interface = self._current_interface()
         if not interface:
             self.sub_title = "No interface selected"
             return
-        ok, msg = run_wg_quick("down", interface)
-        self.refresh_table()
+        self._wg_running = True
+        self._run_wg_quick(action, interface)
+
+    @work(group="wg")
+    async def _run_wg_quick(self, action: str, interface: str) -> None:
+        for button in self._wg_buttons:
+            button.disabled = True
+        self.sub_title = f"Bringing '{interface}' {action}\N{HORIZONTAL ELLIPSIS}"
+        try:
+            ok, msg = await run_wg_quick(action, interface)
+            await self._sync_active_interfaces()
+            await self.refresh_table()
+        finally:
+            self._wg_running = False
+            for button in self._wg_buttons:
+                button.disabled = False
+
         if not ok:
             self.sub_title = msg
+            return
+        # Links can settle just after wg-quick exits; poll once more shortly.
+        self.set_timer(WG_QUICK_SETTLE, self.action_refresh_configs)
 
-    def on_button_pressed(self, event: Button.Pressed) -> None:
+    async def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "up_btn":
             self.action_bring_up()
         elif event.button.id == "down_btn":
             self.action_bring_down()
         elif event.button.id == "refresh_btn":
-            self.action_refresh_configs()
+            await self.action_refresh_configs()
         elif event.button.id == "quit_btn":
             self.exit()
 